@@ -2,10 +2,14 @@ import asyncio
 import os
 import random
 import logging
-import shutil
 import sys
 import argparse
+import atexit
+import json
 import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from pathlib import Path
 import spotipy
 import yt_dlp
@@ -19,6 +23,9 @@ from typing import List, Dict, Optional, Tuple
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# O formato não usa thread/processo; evita buscá-los a cada registro
+logging.logThreads = False
+logging.logProcesses = False
 logger = logging.getLogger(__name__)
 load_dotenv()
 
@@ -26,11 +33,21 @@ load_dotenv()
 AUDIO_DIR = Path("static/audio")
 DOWNLOAD_DURATION = 30
 DB_PATH = "music_cache.db"
-
-# --- Verificação de Downloader Otimizado ---
-ARIA2C_PATH = shutil.which("aria2c")
-if ARIA2C_PATH:
-    logger.info(f"Usando downloader otimizado: {ARIA2C_PATH}")
+DOWNLOAD_RATE = 2.0  # Máximo de downloads iniciados por segundo (todos os workers)
+# PRAGMAs por conexão; o journal_mode=WAL é persistente e aplicado só no init
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+STATUS_BATCH_SIZE = 100  # Atualizações de status gravadas por transação
+STATUS_FLUSH_INTERVAL = 0.5  # Segundos máximos que uma atualização espera na fila
+INSERT_CHUNK_SIZE = 10000  # Faixas inseridas por transação
+SEARCH_CANDIDATES = 3  # Vídeos retornados por busca no YouTube
+PAGE_SIZE = 100  # Máximo de itens por página aceito pela API do Spotify
+SPOTIFY_CONCURRENCY = 5  # Requisições simultâneas ao Spotify
+PLAYLIST_FIELDS = 'total,items.track.id,items.track.name,items.track.artists.name'
 
 # --- Configuração do Spotify ---
 try:
@@ -47,15 +64,27 @@ except Exception as e:
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
 # === GERENCIADOR DE BANCO DE DADOS (Sem alterações) ===
+# Faixa como tupla leve, usada tanto para as linhas da tabela 'tracks' quanto
+# para as faixas vindas do Spotify (que ainda não têm filepath)
+Track = namedtuple('Track', 'id title artist filepath', defaults=(None,))
+
 class DatabaseManager:
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
+        # Uma conexão de longa duração compartilhada pelos workers (via to_thread);
+        # o lock serializa o acesso, já que sqlite3.Connection não é thread-safe
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+        self._lock = threading.Lock()
+        atexit.register(self._conn.close)
         self.init_database()
 
     def init_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.get_connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS tracks (
                         id TEXT PRIMARY KEY, title TEXT NOT NULL, artist TEXT NOT NULL,
@@ -63,43 +92,66 @@ class DatabaseManager:
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )''')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_status ON tracks(status)')
+                # (status, created_at) atende o filtro e o ORDER BY de get_tracks_by_status
+                # sem ordenação extra; o índice antigo só de status fica redundante
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_status_created ON tracks(status, created_at)')
+                cursor.execute('DROP INDEX IF EXISTS idx_tracks_status')
             logger.info(f"Banco de dados inicializado: {self.db_path}")
         except Exception as e:
             logger.error(f"Erro ao inicializar banco de dados: {e}")
             raise
 
+    @contextmanager
     def get_connection(self):
-        return sqlite3.connect(self.db_path, check_same_thread=False)
-
-    def add_tracks_to_db(self, tracks: List[Dict]):
-        if not tracks: return
+        """Entrega a conexão compartilhada com o lock adquirido; commit/rollback na saída."""
+        with self._lock, self._conn:
+            yield self._conn
+
+    def add_tracks_to_db(self, tracks: List[Track]) -> List[str]:
+        """
+        Insere as faixas novas num único statement e retorna os IDs realmente
+        inseridos (RETURNING exige SQLite 3.35+).
+        """
+        if not tracks: return []
+        inserted_ids = []
         try:
-            with self.get_connection() as conn:
-                track_data = [(t['id'], t['title'], t['artist']) for t in tracks]
-                conn.executemany("INSERT OR IGNORE INTO tracks (id, title, artist, status) VALUES (?, ?, ?, 'pending')", track_data)
+            # Blocos com commit entre eles evitam que o WAL cresça sem checkpoint
+            for start in range(0, len(tracks), INSERT_CHUNK_SIZE):
+                chunk = tracks[start:start + INSERT_CHUNK_SIZE]
+                with self.get_connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    # Track já é uma tupla: serializa direto, sem lista intermediária
+                    track_data = json.dumps(chunk)
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO tracks (id, title, artist, status)
+                        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'), 'pending'
+                        FROM json_each(?)
+                        RETURNING id""", (track_data,))
+                    inserted_ids.extend(row[0] for row in cursor.fetchall())
+            return inserted_ids
         except Exception as e:
             logger.error(f"Erro ao adicionar tracks ao banco: {e}")
             raise
 
-    def get_tracks_by_status(self, status: str) -> List[Dict]:
+    def get_tracks_by_status(self, status: str) -> List[Track]:
         try:
             with self.get_connection() as conn:
-                conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
+                cursor.row_factory = lambda _cursor, row: Track(*row)
                 cursor.execute("SELECT id, title, artist, filepath FROM tracks WHERE status = ? ORDER BY created_at", (status,))
-                return [dict(row) for row in cursor.fetchall()]
+                return cursor.fetchall()
         except Exception as e:
             logger.error(f"Erro ao buscar tracks com status '{status}': {e}")
             return []
 
-    def get_all_track_ids(self) -> set:
+    def get_stats(self) -> Dict[str, int]:
+        """Contagem de faixas por status numa única consulta agrupada."""
         try:
             with self.get_connection() as conn:
-                return {row[0] for row in conn.execute('SELECT id FROM tracks')}
+                return dict(conn.execute("SELECT status, COUNT(*) FROM tracks GROUP BY status"))
         except Exception as e:
-            logger.error(f"Erro ao buscar IDs de tracks: {e}")
-            return set()
+            logger.error(f"Erro ao contar tracks por status: {e}")
+            return {}
 
     def update_track_status(self, track_id: str, status: str, filepath: Optional[str] = None):
         try:
@@ -111,171 +163,346 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Erro ao atualizar status da track {track_id}: {e}")
 
+    def update_tracks_status(self, updates: List[Tuple[str, Optional[str], str]]):
+        """Aplica várias tuplas (status, filepath, track_id) numa única transação."""
+        if not updates: return
+        try:
+            with self.get_connection() as conn:
+                conn.executemany("UPDATE tracks SET status = ?, filepath = COALESCE(?, filepath), updated_at = CURRENT_TIMESTAMP WHERE id = ?", updates)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar status de {len(updates)} tracks: {e}")
+
+    def reset_tracks_to_pending(self, track_ids: List[str]):
+        """Volta várias faixas para 'pending' numa única transação."""
+        if not track_ids: return
+        try:
+            with self.get_connection() as conn:
+                conn.executemany("UPDATE tracks SET status = 'pending', filepath = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?", [(tid,) for tid in track_ids])
+        except Exception as e:
+            logger.error(f"Erro ao resetar {len(track_ids)} tracks para 'pending': {e}")
+
 db = DatabaseManager()
 
 # === LÓGICA DE DOWNLOAD REFEITA E ROBUSTA ===
 
+# Opções estáticas do yt-dlp, montadas uma única vez. O yt-dlp só resolve a
+# URL do stream; quem baixa e corta o trecho é o ffmpeg.
+_BASE_YDL_OPTS = {
+    'format': 'bestaudio/best',
+    # Uma busca traz vários candidatos; só o escolhido tem os formatos resolvidos
+    'default_search': f'ytsearch{SEARCH_CANDIDATES}:',
+    'extract_flat': 'in_playlist',
+    'quiet': True,
+    'noprogress': True,
+}
+
+# Queries de busca em ordem de preferência
+SEARCH_QUERY_TEMPLATES = (
+    "{artist} {title} official audio",
+    "{artist} - {title}",
+    "{title} {artist}",
+)
+
+# Criar o YoutubeDL é caro (config, extractors, cookies). Como as opções são
+# fixas, cada thread de download reaproveita a sua instância; uma por thread
+# em vez de uma global com lock, porque o yt-dlp não é thread-safe.
+_ydl_local = threading.local()
+
+def get_youtube_dl() -> yt_dlp.YoutubeDL:
+    """Retorna o YoutubeDL da thread atual, criando-o na primeira chamada."""
+    ydl = getattr(_ydl_local, 'ydl', None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = yt_dlp.YoutubeDL(_BASE_YDL_OPTS)
+    return ydl
+
 def cleanup_files(*files: Path):
     """Remove um ou mais arquivos, ignorando erros se não existirem."""
     for file in files:
         try:
-            if file.exists():
-                file.unlink()
+            file.unlink(missing_ok=True)
         except OSError as e:
-            logger.debug(f"Não foi possível limpar o arquivo {file}: {e}")
+            logger.debug("Não foi possível limpar o arquivo %s: %s", file, e)
+
+def file_size(filepath) -> int:
+    """Tamanho do arquivo em bytes com um único stat; 0 se não existir."""
+    try:
+        return os.stat(filepath).st_size
+    except (OSError, TypeError):
+        return 0
 
-def run_download_and_cut(search_query: str, output_filepath: Path) -> bool:
+def pick_start_time(duration: Optional[float]) -> int:
     """
-    Abordagem em 2 passos: baixa um clipe curto e depois corta com ffmpeg.
-    Isso é MUITO mais confiável do que o pós-processamento do yt-dlp.
+    Sorteia o início do trecho dentro da duração real da música, para que o
+    corte nunca passe do fim do áudio (o que geraria um arquivo curto e um retry).
     """
-    temp_filepath = output_filepath.with_suffix('.temp.webm')
-    cleanup_files(temp_filepath, output_filepath) # Garante um início limpo
+    if not duration:
+        return random.randint(15, 55)
+    latest_start = int(duration) - DOWNLOAD_DURATION - 5
+    if latest_start <= 0:
+        return 0
+    return random.randint(min(15, latest_start), min(55, latest_start))
+
+def _search_candidates(search_query: str) -> List[str]:
+    """Faz uma única busca e retorna as URLs dos vídeos candidatos, em ordem."""
+    try:
+        results = get_youtube_dl().extract_info(search_query, download=False)
+    except Exception as e:
+        logger.error("Falha na busca por '%s'. Erro: %s", search_query, e)
+        return []
+    return [entry['url'] for entry in (results or {}).get('entries') or [] if entry and entry.get('url')]
 
+def _resolve_stream(video_url: str) -> Optional[Dict]:
+    """Resolve os formatos do vídeo e retorna o info dict do melhor áudio."""
+    try:
+        info = get_youtube_dl().extract_info(video_url, download=False)
+    except Exception as e:
+        logger.error("Falha ao resolver o stream de '%s'. Erro: %s", video_url, e)
+        return None
+    if not info or not info.get('url'):
+        logger.debug("Nenhum stream de áudio encontrado.")
+        return None
+    return info
+
+def build_cut_command(info: Dict, output_filepath: Path) -> List[str]:
+    """Monta o argv do ffmpeg que baixa e corta o trecho do stream remoto."""
+    start_time = pick_start_time(info.get('duration'))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Cortando trecho de %ds a partir de %ds.", DOWNLOAD_DURATION, start_time)
+    headers = ''.join(f"{key}: {value}\r\n" for key, value in info.get('http_headers', {}).items())
+    # Se a origem já é opus, só remuxa para webm; senão, re-encoda em libopus
+    if info.get('acodec') == 'opus':
+        codec_opts = {'acodec': 'copy'}
+    else:
+        codec_opts = {'acodec': 'libopus', 'audio_bitrate': '64k'}
+
+    # Usando ffmpeg-python para segurança e controle. 'ss' e 't' como opções
+    # de entrada viram '-ss'/'-t' antes do '-i' (seek no container, sem decodificar
+    # desde o início); '-vn' descarta vídeo se o fallback 'best' trouxer um.
+    return (
+        ffmpeg
+        .input(info['url'], ss=start_time, t=DOWNLOAD_DURATION, headers=headers)
+        .output(str(output_filepath), vn=None, loglevel='error', **codec_opts)
+        .overwrite_output()
+        .compile()
+    )
+
+async def _cut_async(info: Dict, output_filepath: Path) -> bool:
+    """
+    Roda o ffmpeg como subprocesso assíncrono: a espera não ocupa uma thread
+    do pool, que fica livre para as resoluções do yt-dlp.
+    """
+    cleanup_files(output_filepath) # Garante um início limpo
     try:
-        # --- ETAPA 1: Baixar os primeiros 90 segundos ---
-        logger.debug(f"Etapa 1: Baixando clipe temporário para '{search_query}'")
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': str(temp_filepath),
-            'default_search': 'ytsearch1:',
-            # Baixa apenas os primeiros 90 segundos para ser rápido
-            'download_ranges': yt_dlp.utils.download_range_func(None, [(0, 90)]),
-            'quiet': True,
-            'noprogress': True,
-        }
-        if ARIA2C_PATH:
-            ydl_opts['external_downloader'] = ARIA2C_PATH
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([search_query])
-
-        if not temp_filepath.exists() or temp_filepath.stat().st_size < 10000:
-            logger.debug("Download temporário falhou ou arquivo é muito pequeno.")
-            cleanup_files(temp_filepath)
-            return False
-
-        # --- ETAPA 2: Cortar um trecho de 30 segundos do arquivo temporário ---
-        start_time = random.randint(15, 55) # Ponto de início aleatório dentro do clipe de 90s
-        logger.debug(f"Etapa 2: Cortando trecho de {DOWNLOAD_DURATION}s a partir de {start_time}s.")
-        
-        # Usando ffmpeg-python para segurança e controle
-        (
-            ffmpeg
-            .input(str(temp_filepath), ss=start_time, t=DOWNLOAD_DURATION)
-            .output(str(output_filepath), acodec='libopus', audio_bitrate='64k', loglevel='error')
-            .overwrite_output()
-            .run()
+        process = await asyncio.create_subprocess_exec(
+            *build_cut_command(info, output_filepath),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
         )
-        
-        if not output_filepath.exists() or output_filepath.stat().st_size < 5000:
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logger.error("FFmpeg terminou com código %d: %s", process.returncode, stderr.decode(errors='replace').strip())
+        elif file_size(output_filepath) >= 5000:
+            return True
+        else:
             logger.error("Corte com FFmpeg falhou, arquivo final não criado ou muito pequeno.")
-            cleanup_files(temp_filepath, output_filepath)
-            return False
-
-        cleanup_files(temp_filepath) # Limpa o arquivo temporário se tudo deu certo
-        return True
-
     except Exception as e:
-        logger.error(f"Falha no processo de download/corte para '{search_query}'. Erro: {e}")
-        # Garante a limpeza total em caso de qualquer falha
-        cleanup_files(temp_filepath, output_filepath)
-        return False
+        logger.error("Falha no processo de download/corte para '%s'. Erro: %s", info.get('webpage_url'), e)
+    # Garante a limpeza total em caso de qualquer falha
+    cleanup_files(output_filepath)
+    return False
 
-async def download_track_async(track: Dict, is_retry=False):
+async def run_download_and_cut(search_queries: List[str], output_filepath: Path) -> bool:
+    """
+    Tenta os candidatos de cada busca antes de reformular a query, parando
+    no primeiro que gerar um trecho válido.
+    """
+    # Checado uma vez só; o loop roda por query e por candidato
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    for i, query in enumerate(search_queries):
+        if debug_enabled:
+            logger.debug("Tentativa %d/%d com query: %r", i + 1, len(search_queries), query)
+        for video_url in await asyncio.to_thread(_search_candidates, query):
+            info = await asyncio.to_thread(_resolve_stream, video_url)
+            if info and await _cut_async(info, output_filepath):
+                return True
+    return False
+
+class StatusWriter:
+    """
+    Recebe as atualizações de status dos workers numa fila e as grava em lote
+    a partir de uma única tarefa, em vez de uma transação por faixa.
+    """
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, track_id: str, status: str, filepath: Optional[str] = None):
+        await self.queue.put((status, filepath, track_id))
+
+    async def close(self):
+        """Grava o que restou na fila e encerra a tarefa."""
+        await self.queue.put(None)
+        await self._task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            update = await self.queue.get()
+            if update is None:
+                break
+            updates = [update]
+            deadline = loop.time() + STATUS_FLUSH_INTERVAL
+            while len(updates) < STATUS_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    update = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if update is None:
+                    closing = True
+                    break
+                updates.append(update)
+            await asyncio.to_thread(db.update_tracks_status, updates)
+
+async def download_track_async(track: Track, status_writer: StatusWriter, is_retry=False):
     """Tenta baixar a faixa usando múltiplas queries e a nova função robusta."""
-    track_id, title, artist = track['id'], track['title'], track['artist']
+    track_id, title, artist = track.id, track.title, track.artist
     log_prefix = "RE-TENTATIVA" if is_retry else "1ª tentativa"
-    logger.info(f"BAIXANDO ({log_prefix}): '{title} - {artist}'")
+    logger.info("BAIXANDO (%s): '%s - %s'", log_prefix, title, artist)
     
     final_filepath = AUDIO_DIR / f"{track_id}.webm"
 
-    search_queries = [
-        f"{artist} {title} official audio",
-        f"{artist} - {title}",
-        f"{title} {artist}",
-    ]
+    search_queries = [template.format(artist=artist, title=title) for template in SEARCH_QUERY_TEMPLATES]
     
-    for i, query in enumerate(search_queries):
-        logger.debug(f"Tentativa {i+1}/{len(search_queries)} com query: '{query}'")
-        
-        success = await asyncio.to_thread(run_download_and_cut, query, final_filepath)
-        
-        if success:
-            logger.info(f"✅ SUCESSO: '{title}' baixado e processado.")
-            db.update_track_status(track_id, 'downloaded', str(final_filepath))
-            return 'downloaded'
+    success = await run_download_and_cut(search_queries, final_filepath)
+    
+    if success:
+        logger.info("✅ SUCESSO: '%s' baixado e processado.", title)
+        await status_writer.put(track_id, 'downloaded', str(final_filepath))
+        return 'downloaded'
 
     final_status = 'failed_permanent' if is_retry else 'failed'
-    logger.error(f"❌ FALHA: Não foi possível baixar '{title}' (testadas {len(search_queries)} queries).")
-    db.update_track_status(track_id, final_status)
+    logger.error("❌ FALHA: Não foi possível baixar '%s' (testadas %d queries).", title, len(search_queries))
+    await status_writer.put(track_id, final_status)
     return final_status
 
 # === FUNÇÕES PRINCIPAIS (com pequenas otimizações) ===
 
-async def fetch_all_playlists(playlist_urls: List[str]) -> List[Dict]:
+async def fetch_all_playlists(playlist_urls: List[str]) -> List[Track]:
     """Busca todas as playlists de forma concorrente."""
+    # Limite global de requisições simultâneas, para respeitar o rate limit do Spotify
+    semaphore = asyncio.Semaphore(SPOTIFY_CONCURRENCY)
+
+    async def fetch_page(url, offset):
+        async with semaphore:
+            return await asyncio.to_thread(sp.playlist_items, url, limit=PAGE_SIZE, offset=offset, fields=PLAYLIST_FIELDS, additional_types=('track',))
+
     async def fetch(url):
         try:
-            logger.info(f"Buscando faixas da playlist: {url}")
-            results = await asyncio.to_thread(sp.playlist_items, url, fields='items.track.id,items.track.name,items.track.artists.name,next')
+            logger.info("Buscando faixas da playlist: %s", url)
+            # A primeira página revela o 'total'; as demais são buscadas em paralelo
+            first_page = await fetch_page(url, 0)
+            other_pages = await asyncio.gather(*(
+                fetch_page(url, offset)
+                for offset in range(PAGE_SIZE, first_page.get('total', 0), PAGE_SIZE)
+            ))
             tracks = []
-            while results:
+            for results in (first_page, *other_pages):
                 for item in results.get('items', []):
                     if (track := item.get('track')) and track.get('id'):
-                        tracks.append({
-                            'id': track['id'], 'title': track['name'],
-                            'artist': ', '.join(a['name'] for a in track.get('artists', []))
-                        })
-                results = await asyncio.to_thread(sp.next, results) if results.get('next') else None
-            logger.info(f"Encontradas {len(tracks)} faixas em {url.split('/')[-1]}")
+                        artists = track.get('artists', [])
+                        # A maioria das faixas tem um só artista: evita o join
+                        artist = artists[0]['name'] if len(artists) == 1 else ', '.join(a['name'] for a in artists)
+                        tracks.append(Track(track['id'], track['name'], artist))
+            logger.info("Encontradas %d faixas em %s", len(tracks), url.split('/')[-1])
             return tracks
         except Exception as e:
-            logger.error(f"Não foi possível buscar a playlist '{url}'. Erro: {e}")
+            logger.error("Não foi possível buscar a playlist '%s'. Erro: %s", url, e)
             return []
 
     all_tracks_nested = await asyncio.gather(*(fetch(url) for url in playlist_urls))
     return [track for sublist in all_tracks_nested for track in sublist]
 
-async def process_downloads(tracks_to_process: List[Dict], concurrency: int, is_retry=False):
-    if not tracks_to_process: return
-    semaphore = asyncio.Semaphore(concurrency)
+class RateLimiter:
+    """Limita o início de downloads a `rate` por segundo, globalmente entre os workers."""
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_slot = 0.0
 
-    async def run_with_semaphore(track):
-        async with semaphore:
-            await download_track_async(track, is_retry)
-            await asyncio.sleep(random.uniform(0.2, 0.8))
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        delay = max(0.0, self.next_slot - now)
+        self.next_slot = max(now, self.next_slot) + self.interval
+        await asyncio.sleep(delay)
 
-    await asyncio.gather(*(run_with_semaphore(t) for t in tracks_to_process))
+async def process_downloads(tracks_to_process: List[Track], concurrency: int, is_retry=False):
+    """Pipeline limitado: no máximo `concurrency` tarefas vivas ao mesmo tempo."""
+    if not tracks_to_process: return
+    limiter = RateLimiter(DOWNLOAD_RATE)
+    status_writer = StatusWriter()
+    status_writer.start()
+
+    async def run_one(track):
+        await limiter.wait()
+        await download_track_async(track, status_writer, is_retry)
+
+    tracks_iter = iter(tracks_to_process)
+    pending = set()
+    while True:
+        for track in tracks_iter:
+            pending.add(asyncio.create_task(run_one(track)))
+            if len(pending) >= concurrency:
+                break
+        if not pending:
+            break
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception():
+                logger.error("Erro inesperado em um download: %s", task.exception())
+
+    # Garante que todos os status estejam no banco antes da próxima fase
+    await status_writer.close()
 
 def verify_downloaded_files():
     logger.info("Verificando integridade dos arquivos baixados...")
-    downloaded_tracks = db.get_tracks_by_status('downloaded')
-    missing_files = 0
-    for track in downloaded_tracks:
-        filepath = track.get('filepath')
-        if not filepath or not Path(filepath).exists() or Path(filepath).stat().st_size < 5000:
-            logger.warning(f"Arquivo ausente para '{track['title']}'. Resetando para 'pending'.")
-            db.update_track_status(track['id'], 'pending')
-            missing_files += 1
-    if missing_files > 0:
-        logger.info(f"↻ {missing_files} faixas foram resetadas para 'pending'.")
+    # Uma única varredura do diretório em vez de exists()/stat() por faixa
+    with os.scandir(AUDIO_DIR) as it:
+        present = {entry.name.split('.')[0]: entry.stat().st_size for entry in it if entry.name.endswith('.webm')}
+
+    missing_ids = []
+    for track in db.get_tracks_by_status('downloaded'):
+        if not track.filepath or present.get(Path(track.filepath).stem, 0) < 5000:
+            logger.warning("Arquivo ausente para '%s'. Resetando para 'pending'.", track.title)
+            missing_ids.append(track.id)
+
+    if missing_ids:
+        db.reset_tracks_to_pending(missing_ids)
+        logger.info("↻ %d faixas foram resetadas para 'pending'.", len(missing_ids))
     else:
         logger.info("✅ Todos os arquivos baixados estão íntegros.")
 
+async def verify_downloaded_files_async():
+    """Executa verify_downloaded_files fora do event loop."""
+    await asyncio.to_thread(verify_downloaded_files)
+
 async def main(playlist_urls: List[str], concurrency: int):
     logger.info("=" * 60 + "\nINICIANDO PROCESSO DE CACHE DE MÚSICAS\n" + "=" * 60)
-    verify_downloaded_files()
-    
-    existing_ids = db.get_all_track_ids()
-    logger.info(f"{len(existing_ids)} faixas já no banco de dados.")
-
-    all_tracks_from_spotify = await fetch_all_playlists(playlist_urls)
-    new_tracks_to_add = [t for t in all_tracks_from_spotify if t['id'] not in existing_ids]
-
-    if new_tracks_to_add:
-        db.add_tracks_to_db(new_tracks_to_add)
-        logger.info(f"✅ Adicionadas {len(new_tracks_to_add)} novas faixas ao banco.")
+    # A verificação (disco + banco) roda numa thread enquanto as playlists são buscadas
+    _, all_tracks_from_spotify = await asyncio.gather(
+        verify_downloaded_files_async(),
+        fetch_all_playlists(playlist_urls),
+    )
+    # O INSERT OR IGNORE já descarta as existentes; RETURNING diz quais entraram
+    new_track_ids = db.add_tracks_to_db(all_tracks_from_spotify)
+
+    if new_track_ids:
+        logger.info("✅ Adicionadas %d novas faixas ao banco.", len(new_track_ids))
     else:
         logger.info("Nenhuma faixa nova para adicionar.")
 
@@ -283,7 +510,7 @@ async def main(playlist_urls: List[str], concurrency: int):
     logger.info("\n" + "=" * 60 + "\nFASE 1: PRIMEIRA TENTATIVA DE DOWNLOAD\n" + "=" * 60)
     pending_tracks = db.get_tracks_by_status('pending')
     if pending_tracks:
-        logger.info(f"Encontradas {len(pending_tracks)} faixas pendentes.")
+        logger.info("Encontradas %d faixas pendentes.", len(pending_tracks))
         await process_downloads(pending_tracks, concurrency, is_retry=False)
     else:
         logger.info("Nenhuma faixa pendente para a primeira tentativa.")
@@ -292,7 +519,7 @@ async def main(playlist_urls: List[str], concurrency: int):
     logger.info("\n" + "=" * 60 + "\nFASE 2: SEGUNDA TENTATIVA PARA FALHAS\n" + "=" * 60)
     failed_tracks = db.get_tracks_by_status('failed')
     if failed_tracks:
-        logger.info(f"Encontradas {len(failed_tracks)} faixas para nova tentativa.")
+        logger.info("Encontradas %d faixas para nova tentativa.", len(failed_tracks))
         await process_downloads(failed_tracks, concurrency, is_retry=True)
     else:
         logger.info("Nenhuma faixa falhou na primeira tentativa. Ótimo!")
@@ -1,27 +1,60 @@
 
+import atexit
 import sqlite3
 import logging
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Literal
 
 # --- Configuração ---
 DB_PATH = Path("cache.db")
+# PRAGMAs por conexão; o journal_mode=WAL é persistente e aplicado só no setup
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
 logger = logging.getLogger(__name__)
 
+INSERT_CHUNK_SIZE = 10000  # Faixas inseridas por transação
+
 # --- Tipos de Status ---
 TrackStatus = Literal["pending", "downloaded", "failed", "failed_permanent"]
 
+# --- Conexões por thread ---
+# Cada thread reaproveita a sua conexão em vez de abrir uma nova a cada operação
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
 def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    """Retorna a conexão da thread atual, criando-a na primeira chamada."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # Sem row_factory na conexão: consultas só de IDs ficam com tuplas simples
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
+@atexit.register
+def close_db_connections():
+    """Fecha todas as conexões abertas ao encerrar o interpretador."""
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
 def setup_database():
     """Cria a tabela de faixas se ela não existir."""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS tracks (
                     id TEXT PRIMARY KEY,
@@ -58,15 +91,19 @@ def add_tracks_to_db(tracks: List[Dict]):
         return
 
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            # O "OR IGNORE" previne erros se a faixa (chave primária) já existir
-            cursor.executemany(
-                "INSERT OR IGNORE INTO tracks (id, title, artist) VALUES (?, ?, ?)",
-                tracks_to_insert
-            )
-            conn.commit()
-        logger.info(f"{cursor.rowcount} novas faixas adicionadas ao banco de dados para processamento.")
+        inserted = 0
+        # Transação explícita por bloco; o commit entre blocos deixa o WAL fazer checkpoint
+        for start in range(0, len(tracks_to_insert), INSERT_CHUNK_SIZE):
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                # O "OR IGNORE" previne erros se a faixa (chave primária) já existir
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO tracks (id, title, artist) VALUES (?, ?, ?)",
+                    tracks_to_insert[start:start + INSERT_CHUNK_SIZE]
+                )
+                inserted += cursor.rowcount
+        logger.info(f"{inserted} novas faixas adicionadas ao banco de dados para processamento.")
     except sqlite3.Error as e:
         logger.error(f"Erro ao adicionar faixas ao banco de dados: {e}")
 
@@ -89,11 +126,35 @@ def update_track_status(track_id: str, status: TrackStatus, filepath: Optional[s
     except sqlite3.Error as e:
         logger.error(f"Erro ao atualizar o status da faixa {track_id}: {e}")
 
+def reset_tracks_to_pending(track_ids: List[str]) -> int:
+    """
+    Volta várias faixas para 'pending' numa única transação. Por ser uma
+    manutenção pontual, usa journal em memória e restaura o WAL no fim.
+    """
+    if not track_ids:
+        return 0
+    try:
+        conn = get_db_connection()
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        try:
+            with conn:
+                cursor = conn.executemany(
+                    "UPDATE tracks SET status = 'pending', attempts = attempts + 1 WHERE id = ?",
+                    [(track_id,) for track_id in track_ids]
+                )
+            return cursor.rowcount
+        finally:
+            conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao resetar {len(track_ids)} faixas para 'pending': {e}")
+        return 0
+
 def get_tracks_by_status(status: TrackStatus) -> List[Dict]:
     """Busca todas as faixas com um determinado status."""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute("SELECT id, title, artist, filepath FROM tracks WHERE status = ?", (status,))
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -101,6 +162,29 @@ def get_tracks_by_status(status: TrackStatus) -> List[Dict]:
         logger.error(f"Erro ao buscar faixas por status '{status}': {e}")
         return []
 
+def get_status_counts() -> Dict[str, int]:
+    """Retorna a quantidade de faixas por status com uma única consulta agrupada."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM tracks GROUP BY status")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao contar faixas por status: {e}")
+        return {}
+
+def get_track_samples(status: TrackStatus, limit: int = 3) -> List[Dict]:
+    """Busca apenas algumas faixas de um status, para exibição."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT id, title, artist, filepath FROM tracks WHERE status = ? LIMIT ?", (status, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao buscar amostras de faixas com status '{status}': {e}")
+        return []
+
 def get_all_processed_track_ids() -> set:
     """
     Retorna um conjunto de IDs de faixas que já foram baixadas com sucesso
@@ -110,8 +194,7 @@ def get_all_processed_track_ids() -> set:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT id FROM tracks WHERE status IN ('downloaded', 'failed_permanent')")
-            rows = cursor.fetchall()
-            return {row['id'] for row in rows}
+            return {row[0] for row in cursor}
     except sqlite3.Error as e:
         logger.error(f"Erro ao buscar IDs de faixas processadas: {e}")
         return set()
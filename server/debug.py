@@ -19,6 +19,15 @@ except ImportError:
     print("Verifique se você está na pasta correta e se o arquivo db_manager.py existe")
     sys.exit(1)
 
+def scan_audio_dir(audio_dir: Path) -> dict:
+    """Lista os .webm do diretório numa única passada, retornando {nome: tamanho}."""
+    # O DirEntry do scandir já traz o stat em cache
+    try:
+        with os.scandir(audio_dir) as it:
+            return {e.name: e.stat().st_size for e in it if e.name.endswith('.webm')}
+    except FileNotFoundError:
+        return {}
+
 def debug_database():
     """Função para debugar o estado atual do banco de dados"""
     
@@ -27,10 +36,12 @@ def debug_database():
     try:
         # 1. Verificar se o banco existe
         db_path = Path("music_cache.db")  # Assumindo que é esse o nome
-        if db_path.exists():
+        # Um único stat: exists() já seria um stat por si só
+        try:
+            db_size = db_path.stat().st_size
             print(f"✅ Banco de dados encontrado: {db_path}")
-            print(f"   Tamanho: {db_path.stat().st_size} bytes")
-        else:
+            print(f"   Tamanho: {db_size} bytes")
+        except OSError:
             print(f"❌ Banco de dados não encontrado em: {db_path}")
             
         # 2. Tentar conectar e verificar tabelas
@@ -40,25 +51,22 @@ def debug_database():
         
         # 3. Verificar status das tracks
         print("\n--- Status das Tracks ---")
-        status_counts = {}
+        # Uma única consulta agrupada em vez de carregar todas as tracks de cada status
+        status_counts = db_manager.get_status_counts()
         
         # Verificar cada status possível
         statuses_to_check = ['pending', 'downloaded', 'failed', 'failed_permanent']
         
         for status in statuses_to_check:
             try:
-                tracks = db_manager.get_tracks_by_status(status)
-                count = len(tracks)
-                status_counts[status] = count
+                count = status_counts.get(status, 0)
                 print(f"  {status}: {count} tracks")
                 
                 # Mostrar algumas tracks como exemplo
-                if count > 0 and count <= 3:
-                    for track in tracks:
-                        print(f"    - {track.get('title', 'N/A')} por {track.get('artist', 'N/A')}")
-                elif count > 3:
-                    for i, track in enumerate(tracks[:3]):
+                if count > 0:
+                    for track in db_manager.get_track_samples(status, 3):
                         print(f"    - {track.get('title', 'N/A')} por {track.get('artist', 'N/A')}")
+                if count > 3:
                     print(f"    ... e mais {count - 3} tracks")
                         
             except Exception as e:
@@ -67,18 +75,18 @@ def debug_database():
         # 4. Verificar arquivos no diretório
         print("\n--- Arquivos no Diretório ---")
         audio_dir = Path("static/audio")
+        audio_files = scan_audio_dir(audio_dir)
         if audio_dir.exists():
-            audio_files = list(audio_dir.glob("*.webm"))
             print(f"  Arquivos .webm encontrados: {len(audio_files)}")
             
             if len(audio_files) > 0:
-                total_size = sum(f.stat().st_size for f in audio_files)
+                total_size = sum(audio_files.values())
                 print(f"  Tamanho total: {total_size / (1024*1024):.2f} MB")
                 
                 # Verificar alguns arquivos
-                for i, file in enumerate(audio_files[:5]):
-                    size_kb = file.stat().st_size / 1024
-                    print(f"    - {file.name}: {size_kb:.1f} KB")
+                for name, size in list(audio_files.items())[:5]:
+                    size_kb = size / 1024
+                    print(f"    - {name}: {size_kb:.1f} KB")
                 if len(audio_files) > 5:
                     print(f"    ... e mais {len(audio_files) - 5} arquivos")
         else:
@@ -93,8 +101,7 @@ def debug_database():
         elif status_counts.get('pending', 0) == 0:
             print("  ⚠️  Não há tracks pendentes para download.")
             if status_counts.get('downloaded', 0) > 0:
-                audio_files_count = len(list(audio_dir.glob("*.webm"))) if audio_dir.exists() else 0
-                if audio_files_count == 0:
+                if not audio_files:
                     print("  💡 Sugestão: Tracks marcadas como downloaded mas sem arquivos. Use --reset-missing")
                 else:
                     print("  ✅ Tracks já foram baixadas com sucesso.")
@@ -116,25 +123,27 @@ def reset_failed_downloads():
     try:
         audio_dir = Path("static/audio")
         reset_count = 0
+        # Tamanhos de todos os arquivos de uma vez, em vez de um stat por track
+        audio_files = scan_audio_dir(audio_dir)
         
         # 1. Resetar tracks marcadas como downloaded mas sem arquivo
+        missing_ids = []
         downloaded_tracks = db_manager.get_tracks_by_status('downloaded')
         for track in downloaded_tracks:
             if track.get('filepath'):
-                file_path = Path(track['filepath'])
-                if not file_path.exists() or file_path.stat().st_size < 1000:  # menor que 1KB
-                    db_manager.update_track_status(track['id'], 'pending')
-                    reset_count += 1
+                size = audio_files.get(os.path.basename(track['filepath']), 0)
+                if size < 1000:  # menor que 1KB
+                    missing_ids.append(track['id'])
                     print(f"  ↻ Resetado: {track['title']} - {track['artist']}")
+        # Um único UPDATE em lote em vez de uma transação por track
+        reset_count += db_manager.reset_tracks_to_pending(missing_ids)
         
         # 2. Resetar falhas permanentes para nova tentativa (opcional)
         failed_permanent = db_manager.get_tracks_by_status('failed_permanent')
         if len(failed_permanent) > 0:
             response = input(f"\nResetar {len(failed_permanent)} falhas permanentes? (s/N): ")
             if response.lower() in ['s', 'sim', 'y', 'yes']:
-                for track in failed_permanent:
-                    db_manager.update_track_status(track['id'], 'pending')
-                    reset_count += len(failed_permanent)
+                reset_count += db_manager.reset_tracks_to_pending([track['id'] for track in failed_permanent])
                 print(f"  ↻ Resetadas {len(failed_permanent)} falhas permanentes")
         
         print(f"\n✅ Total resetado: {reset_count} tracks")
@@ -1,33 +1,57 @@
 import asyncio
+import bisect
+import functools
+import hashlib
 import os
 import random
 import time
 import logging
 import re
-import shutil
+import string
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import msgpack
+import orjson
 import spotipy
 import yt_dlp
 from spotipy.oauth2 import SpotifyClientCredentials
 from dotenv import load_dotenv
 from fastapi import WebSocket
-from typing import Dict, List, Set, Optional, Tuple
+from typing import Dict, List, Set, Optional, Tuple, Union
 
 # --- Configuração ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-# --- Cache de Playlist ---
-playlist_cache: Dict[str, Tuple[float, List[Dict]]] = {}
-CACHE_TTL = 300  # 5 minutos
+# --- WebSocket ---
+OUTBOUND_QUEUE_SIZE = 64  # mensagens pendentes por cliente antes de derrubar a conexão
+BROADCAST_COALESCE_DELAY = 0.01  # janela para juntar mensagens não urgentes num só frame
+
+# --- Downloads ---
+DOWNLOAD_CONCURRENCY = 4  # downloads simultâneos por sala
+DOWNLOAD_WAIT_TIMEOUT = 60  # segundos que uma rodada espera pelo download da música
 
-# --- Verificação de Downloader Otimizado ---
-ARIA2C_PATH = shutil.which("aria2c")
-if not ARIA2C_PATH:
-    logger.warning("AVISO: O downloader 'aria2c' não foi encontrado no seu sistema. Os downloads de músicas podem ser significativamente mais lentos. Instale-o para obter o melhor desempenho.")
-else:
-    logger.info(f"Usando downloader otimizado: {ARIA2C_PATH}")
+# --- Pools de threads ---
+# Separados para que downloads lentos do yt-dlp não segurem as chamadas rápidas ao Spotify
+_SPOTIFY_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='spotify')
+_YTDLP_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='yt-dlp')
+SPOTIFY_KEEPALIVE_INTERVAL = 4 * 60  # segundos entre chamadas que mantêm a conexão com o Spotify aberta
+
+# --- Cache de Playlist ---
+DETAILS_CACHE_TTL = 24 * 60 * 60  # nome, capa e dono quase nunca mudam
+TRACKS_CACHE_TTL = 60 * 60
+PLAYLIST_CACHE_MAX_ENTRIES = 256  # playlists mantidas em memória por cache; as menos usadas saem primeiro
+PLAYLIST_CACHE_DIR = Path("playlist_cache")  # sobrevive a reinícios do servidor
+PAGE_SIZE = 100  # máximo de faixas por página que a API do Spotify devolve
+PLAYLIST_FIELDS = 'total,items.track.id,items.track.name,items.track.artists.name,items.track.preview_url'
+VIDEO_INDEX_PATH = PLAYLIST_CACHE_DIR / "youtube_index.json"  # busca no YouTube -> URL do vídeo escolhido
+VIDEO_INDEX_FLUSH_DELAY = 10  # segundos juntando mudanças no índice antes de regravar o arquivo
+PREVIEW_DURATION = 30  # segundos do preview_url do Spotify; rodadas até isso não usam o YouTube
+PREVIEW_TIMEOUT = 15  # segundos para baixar um preview do CDN do Spotify
 
 try:
     sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
@@ -38,26 +62,381 @@ except Exception:
     logger.error("ERRO: Verifique suas credenciais do Spotify no arquivo .env.")
     sp = None
 
-Path("static/audio").mkdir(parents=True, exist_ok=True)
+AUDIO_DIR = Path("static/audio")
+AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+# Acima disso os trechos menos usados são apagados. Desligado por padrão (0): o cache.py
+# também grava em static/audio e o banco dele não fica sabendo dos arquivos apagados
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_MB") or 0) * 1024 ** 2
+AUDIO_EXTENSIONS = ('.webm', '.mp3')  # .part do yt-dlp e .tmp dos previews ficam de fora
+
+# Opções do yt-dlp que não mudam entre downloads (montadas uma única vez)
+# O áudio do YouTube já costuma ser opus/webm, então não há pós-processamento.
+# Só webm: o arquivo é salvo e servido como {id}.webm, e um m4a com esse nome
+# não toca em todo navegador. Sem downloader externo: com download_ranges quem
+# baixa o trecho é o ffmpeg
+_BASE_YDL_OPTS = {
+    'format': 'bestaudio[ext=webm][acodec=opus]/bestaudio[ext=webm]',
+    'quiet': True,
+    'default_search': 'ytsearch1',
+}
+
+# Um YoutubeDL por thread do pool: os extractors são carregados uma vez só,
+# e como ninguém mais usa a instância, os params podem mudar a cada download
+_ydl_local = threading.local()
+
+def get_youtube_dl() -> yt_dlp.YoutubeDL:
+    ydl = getattr(_ydl_local, 'ydl', None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = yt_dlp.YoutubeDL(_BASE_YDL_OPTS)
+    return ydl
+
+class PlaylistCache:
+    """TTL cache keyed by playlist URL, shared by every room and mirrored to disk."""
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, object]] = OrderedDict()  # least recently used first
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._callers: Dict[str, int] = {}  # callers holding or waiting on each lock
+
+    def _fresh(self, url: str):
+        entry = self._entries.get(url)
+        if entry and time.time() - entry[0] < self.ttl:
+            self._entries.move_to_end(url)
+            return entry[1]
+        return None
+
+    def _remember(self, url: str, fetched_at: float, value):
+        self._entries[url] = (fetched_at, value)
+        self._entries.move_to_end(url)
+        while len(self._entries) > PLAYLIST_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)  # still on disk if it's needed again
+
+    def _path(self, url: str) -> Path:
+        return PLAYLIST_CACHE_DIR / f"{self.name}-{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+    def _read(self, url: str) -> Optional[Dict]:
+        # Runs in a worker thread: only reads and parses, the entries are updated on the loop
+        try:
+            return orjson.loads(self._path(url).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
 
+    def _store(self, url: str, fetched_at: float, value):
+        path = self._path(url)
+        try:
+            PLAYLIST_CACHE_DIR.mkdir(exist_ok=True)
+            # Writes a temp file and renames it, so a crash never leaves half a file
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(orjson.dumps({"fetched_at": fetched_at, "value": value}))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist {self.name} cache for {url}: {e}")
+
+    async def get(self, url: str, fetch):
+        """Returns the cached value or awaits fetch() once per URL, even with concurrent callers."""
+        value = self._fresh(url)
+        if value is not None:
+            return value
+        # Rooms created at the same time for the same playlist wait for a single request
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        self._callers[url] = self._callers.get(url, 0) + 1
+        try:
+            async with lock:
+                value = self._fresh(url)
+                if value is None:
+                    entry = await asyncio.to_thread(self._read, url)
+                    if entry:
+                        self._remember(url, entry['fetched_at'], entry['value'])
+                        value = self._fresh(url)
+                if value is None:
+                    value = await fetch()
+                    fetched_at = time.time()
+                    self._remember(url, fetched_at, value)
+                    await asyncio.to_thread(self._store, url, fetched_at, value)
+                return value
+        finally:
+            # Dropped with the last caller, so locks don't pile up for every URL ever seen.
+            # locked() alone isn't enough: it's already False while a woken waiter is queued
+            self._callers[url] -= 1
+            if not self._callers[url]:
+                del self._callers[url]
+                del self._locks[url]
+
+    def pop(self, url: str):
+        self._entries.pop(url, None)
+        self._path(url).unlink(missing_ok=True)
+
+class VideoIndex:
+    """Remembers which YouTube video each search resolved to, so a song is only searched once.
+    Used from the yt-dlp threads, hence the lock. Changes are written to disk in batches."""
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # keeps two flushes from writing out of order
+        self._urls: Optional[Dict[str, str]] = None  # loaded from disk on first use
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def _load(self) -> Dict[str, str]:
+        if self._urls is None:
+            try:
+                self._urls = orjson.loads(self.path.read_bytes())
+            except (OSError, orjson.JSONDecodeError):
+                self._urls = {}
+        return self._urls
+
+    def get(self, query: str) -> Optional[str]:
+        with self._lock:
+            return self._load().get(query)
+
+    def put(self, query: str, url: str):
+        with self._lock:
+            self._load()[query] = url
+            self._changed()
+
+    def discard(self, query: str):
+        """Forgets a video that no longer works, so the next download searches again."""
+        with self._lock:
+            if self._load().pop(query, None) is not None:
+                self._changed()
+
+    def _changed(self):
+        # Called with the lock held: one write per batch of changes instead of one per download
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(VIDEO_INDEX_FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if self._flush_timer:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                payload = orjson.dumps(self._urls)
+                self._dirty = False
+            # Serialized under the lock, written outside it: downloads don't wait on the disk
+            try:
+                self.path.parent.mkdir(exist_ok=True)
+                tmp_path = self.path.with_suffix('.tmp')
+                tmp_path.write_bytes(payload)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not persist YouTube index: {e}")
+
+video_index = VideoIndex(VIDEO_INDEX_PATH)
+
+playlist_cache = PlaylistCache("tracks", TRACKS_CACHE_TTL)
+playlist_details_cache = PlaylistCache("details", DETAILS_CACHE_TTL)
+
+async def run_spotify(func, *args, **kwargs):
+    """Runs a blocking spotipy call on the Spotify pool."""
+    return await asyncio.get_running_loop().run_in_executor(_SPOTIFY_POOL, functools.partial(func, *args, **kwargs))
+
+async def run_ytdlp(func, *args):
+    """Runs a blocking yt-dlp call on the download pool."""
+    return await asyncio.get_running_loop().run_in_executor(_YTDLP_POOL, func, *args)
+
+async def keep_spotify_warm():
+    """Periodically makes a cheap Spotify call so the access token and the pooled
+    HTTPS connection are already up when a room is created."""
+    while sp:
+        try:
+            await run_spotify(sp.user, 'spotify')
+        except Exception as e:
+            logger.warning(f"Spotify keepalive failed: {e}")
+        await asyncio.sleep(SPOTIFY_KEEPALIVE_INTERVAL)
+
+# Downloads em andamento, compartilhados entre salas: nome do arquivo -> task
+_inflight_downloads: Dict[str, asyncio.Task] = {}
+
+class AudioCache:
+    """The snippets in AUDIO_DIR, least recently used first, trimmed to a size quota
+    (no quota when max_bytes is 0). Files pinned by a game in progress are never evicted.
+    Blocking (scan, stat, unlink), so it is called through asyncio.to_thread; the lock
+    covers the pool threads."""
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files: Optional[OrderedDict[str, int]] = None  # name -> size, filled by the first scan
+        self._total = 0
+        self._pins: Dict[str, int] = {}  # name -> number of games using it
+
+    def _scan(self) -> OrderedDict:
+        if self._files is None:
+            # A single scandir at first use; the mtime stands in for the last use
+            with os.scandir(self.directory) as it:
+                stats = [(e.name, e.stat()) for e in it if e.name.endswith(AUDIO_EXTENSIONS) and e.is_file()]
+            stats.sort(key=lambda item: item[1].st_mtime)
+            self._files = OrderedDict((name, st.st_size) for name, st in stats)
+            self._total = sum(self._files.values())
+        return self._files
+
+    def pin(self, names: List[str]) -> Set[str]:
+        """Marks names as used by a game: refreshed in the LRU and kept until unpinned.
+        Returns the ones already on disk, checked under the same lock so an eviction
+        can't slip in between."""
+        present = set()
+        with self._lock:
+            files = self._scan()
+            for name in names:
+                self._pins[name] = self._pins.get(name, 0) + 1
+                # One stat per file: picks up snippets written by cache.py and
+                # forgets files deleted behind the server's back
+                try:
+                    size = (self.directory / name).stat().st_size
+                except OSError:
+                    self._total -= files.pop(name, 0)
+                    continue
+                self._total += size - files.get(name, 0)
+                files[name] = size
+                files.move_to_end(name)
+                present.add(name)
+        return present
+
+    def unpin(self, names: List[str]):
+        with self._lock:
+            for name in names:
+                count = self._pins.get(name, 0) - 1
+                if count > 0:
+                    self._pins[name] = count
+                else:
+                    self._pins.pop(name, None)
+            self._evict()
+
+    def add(self, name: str):
+        """Records a freshly downloaded file and makes room for it if over the quota."""
+        with self._lock:
+            files = self._scan()
+            try:
+                size = (self.directory / name).stat().st_size
+            except OSError:
+                return
+            self._total += size - files.get(name, 0)
+            files[name] = size
+            files.move_to_end(name)
+            self._evict()
+
+    def _evict(self):
+        if not self.max_bytes:
+            return
+        files = self._scan()
+        for name in list(files):
+            if self._total <= self.max_bytes:
+                break
+            if name in self._pins:
+                continue
+            try:
+                (self.directory / name).unlink(missing_ok=True)
+            except OSError as e:
+                # Left in the index: it's still on disk, and a later eviction can retry it
+                logger.warning(f"Could not evict cached audio {name}: {e}")
+                continue
+            self._total -= files.pop(name)
+            logger.info(f"Evicted cached audio {name}")
+
+audio_cache = AudioCache(AUDIO_DIR, AUDIO_CACHE_MAX_BYTES)
+
+def _dumps(message: dict) -> str:
+    # orjson gera o mesmo JSON compacto em UTF-8 que o send_json, só que bem mais rápido
+    return orjson.dumps(message).decode()
+
+def _encode(message: dict, binary: bool) -> Union[str, bytes]:
+    # Clientes que negociaram 'msgpack' recebem frames binários; os demais, JSON texto
+    if binary:
+        return msgpack.packb(message, use_bin_type=True)
+    return _dumps(message)
+
+# Padrões do normalize_string, compilados uma única vez
+_PAREN_TAG_RE = re.compile(r'\s*[\(\[].*(feat|ft|with|remix|remaster|live|edit|version|deluxe)[\)\]].*')
+# Apaga todo ASCII que não seja a-z, 0-9, espaço ou apóstrofo (o não-ASCII já sai antes)
+_PUNCT_TABLE = str.maketrans('', '', ''.join(c for c in map(chr, range(128)) if c not in string.ascii_lowercase + string.digits + string.whitespace + "'"))
+
+@functools.lru_cache(maxsize=4096)
 def normalize_string(text: str) -> str:
     text = text.lower()
-    text = re.sub(r'\s*[\(\[].*(feat|ft|with|remix|remaster|live|edit|version|deluxe)[\)\]].*', '', text, flags=re.IGNORECASE).strip()
+    text = _PAREN_TAG_RE.sub('', text).strip()
     text = text.split(' - ')[0]
-    text = re.sub(r'[\(\)\[\]]', '', text).strip()
-    text = re.sub(r"[^a-z0-9\\s']", '', text)
-    text = ' '.join(text.split())
-    return text.strip()
+    text = text.encode('ascii', 'ignore').decode('ascii').translate(_PUNCT_TABLE)
+    # Sem espaço nenhum: "cha cha slide", "Cha-Cha Slide" e "chachaslide" dão no mesmo
+    return ''.join(text.split())
+
+# Participação fora de parênteses: "Song feat. Fulano"
+_BARE_FEAT_RE = re.compile(r'\s+(feat|ft)\.?\s.*', re.IGNORECASE)
+
+def accepted_titles(title: str) -> frozenset:
+    """Normalized forms of title a guess may match: the full title, the title
+    without any parenthesized part and without a trailing featuring credit."""
+    variants = {normalize_string(title), normalize_string(title.split('(')[0]), normalize_string(_BARE_FEAT_RE.sub('', title))}
+    variants.discard('')
+    return frozenset(variants)
 
 class Player:
-    def __init__(self, username: str, websocket: Optional[WebSocket]):
+    __slots__ = ('username', 'websocket', 'binary', 'score', 'wins', 'has_answered', 'gave_up', 'guess_time', 'out_queue', 'writer_task')
+
+    def __init__(self, username: str, websocket: Optional[WebSocket], binary: bool = False):
         self.username = username
         self.websocket = websocket
+        self.binary = binary  # whether this connection speaks MessagePack
         self.score = 0
         self.wins = 0
         self.has_answered = False
         self.gave_up = False
         self.guess_time: Optional[float] = None
+        self.out_queue: asyncio.Queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+
+    def start_writer(self):
+        """(Re)starts the task that drains out_queue into the current websocket."""
+        self.stop_writer()
+        if self.websocket:
+            # Messages queued for a previous connection are dropped
+            self.out_queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+            self.writer_task = asyncio.create_task(self._writer_loop(self.websocket))
+
+    def stop_writer(self):
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
+
+    def send(self, payload: Union[str, bytes]):
+        """Queues an already serialized message (text or binary frame) without blocking the caller."""
+        if not self.writer_task:
+            return  # Not connected, or already being disconnected
+        try:
+            self.out_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Client is too far behind: close it and let the disconnect path clean up
+            logger.warning(f"Outbound queue full for {self.username}, closing connection.")
+            self.stop_writer()
+            if self.websocket:
+                asyncio.create_task(self.websocket.close(code=1013))
+
+    def send_message(self, message: dict):
+        self.send(_encode(message, self.binary))
+
+    def send_cached(self, message: dict, payloads: Dict[bool, Union[str, bytes]]):
+        """Sends message, reusing (or filling) payloads, its encodings keyed by format."""
+        payload = payloads.get(self.binary)
+        if payload is None:
+            payload = payloads[self.binary] = _encode(message, self.binary)
+        self.send(payload)
+
+    async def _writer_loop(self, websocket: WebSocket):
+        while True:
+            payload = await self.out_queue.get()
+            try:
+                if isinstance(payload, bytes):
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload)
+            except Exception as e:
+                logger.warning(f"Could not send message to {self.username}: {e}")
 
     def to_dict(self):
         return {"username": self.username, "score": self.score, "wins": self.wins, "has_answered": self.has_answered, "gave_up": self.gave_up, "guess_time": self.guess_time}
@@ -71,11 +450,19 @@ class Player:
         self.reset_for_new_round()
         self.score = 0
 
+# Placeholder queued by broadcast_player_update; the real list is built when it's sent
+_PLAYER_UPDATE = {"type": "update_players"}
+
+def _score_key(player: Player) -> int:
+    return -player.score
+
 class GameRoom:
     def __init__(self, host: Player, playlist_url: str, round_duration: int, total_rounds: int):
         self.room_id = "".join(random.choices("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", k=5))
         self.host = host
         self.players: Dict[str, Player] = {}
+        self._scoreboard: List[Player] = []  # players ordered by score, highest first
+        self._connected: List[Player] = []  # players with a websocket, kept up to date by add/remove_player
         self.playlist_url = playlist_url
         self.playlist_name: Optional[str] = None
         self.playlist_cover_image_url: Optional[str] = None
@@ -87,16 +474,24 @@ class GameRoom:
         self.round_start_time = 0
         self.game_tracks: List[Dict] = []
         self.all_playlist_titles: List[str] = []
+        self._prepared_message: Optional[Dict] = None
+        self._prepared_payloads: Dict[bool, Union[str, bytes]] = {}  # game_prepared, serialized once per game and format
         self.played_track_ids: Set[str] = set()
         self.first_track_ready = False
         self._round_end_event = asyncio.Event()
+        self._pending_players = 0  # players who haven't answered or given up this round
         self._preparation_complete_event = asyncio.Event()
         self._round_task: Optional[asyncio.Task] = None
         self._download_tasks: List[asyncio.Task] = []
+        self._pinned_files: List[str] = []  # audio files this game holds in the audio cache
+        self._prepare_task: Optional[asyncio.Task] = None
+        self._download_sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        self._pending_broadcasts: List[Dict] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
 
     async def fetch_playlist_details(self):
         try:
-            playlist = await asyncio.to_thread(sp.playlist, self.playlist_url)
+            playlist = await playlist_details_cache.get(self.playlist_url, self._fetch_playlist_details)
             self.playlist_name = playlist.get('name')
             self.playlist_owner_name = playlist.get('owner', {}).get('display_name')
             if playlist.get('images'):
@@ -109,42 +504,97 @@ class GameRoom:
 
     async def broadcast(self, message: dict, to_host_only=False):
         if to_host_only:
-            websockets = [self.host.websocket] if self.host.websocket and self.host.username in self.players else []
+            # Anything still waiting to be coalesced goes out first, to keep the order
+            self._flush_broadcasts()
+            self._send(message, to_host_only)
         else:
-            websockets = [p.websocket for p in self.players.values() if p.websocket]
-        
-        for ws in websockets:
-            try:
-                await ws.send_json(message)
-            except Exception as e:
-                logger.warning(f"Could not send message to a websocket: {e}")
+            # Rides along with the pending messages: one frame at round boundaries
+            self._pending_broadcasts.append(message)
+            self._flush_broadcasts()
+
+    def queue_broadcast(self, message: dict):
+        """Sends a non-urgent message to everyone after a short delay, batched with the others."""
+        if message["type"] == "update_players":
+            # Only the latest player list matters
+            self._pending_broadcasts = [m for m in self._pending_broadcasts if m["type"] != "update_players"]
+        self._pending_broadcasts.append(message)
+        if not self._flush_handle:
+            self._flush_handle = asyncio.get_running_loop().call_later(BROADCAST_COALESCE_DELAY, self._flush_broadcasts)
+
+    def _flush_broadcasts(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_broadcasts:
+            return
+        messages, self._pending_broadcasts = self._pending_broadcasts, []
+        messages = [self._player_update_message() if m is _PLAYER_UPDATE else m for m in messages]
+        self._send(messages[0] if len(messages) == 1 else {"type": "batch", "messages": messages})
+
+    def _recipients(self, to_host_only=False) -> List[Player]:
+        if to_host_only:
+            return [self.host] if self.host.websocket and self.host.username in self.players else []
+        return self._connected
+
+    def _send(self, message: dict, to_host_only=False, payloads: Optional[Dict[bool, Union[str, bytes]]] = None):
+        # Serialized at most once per format, however many recipients.
+        # Only enqueues: each player's writer task does the actual send,
+        # so a slow client can't hold up the game loop
+        payloads = {} if payloads is None else payloads
+        for player in self._recipients(to_host_only):
+            player.send_cached(message, payloads)
+
+    def broadcast_cached(self, message: dict, payloads: Dict[bool, Union[str, bytes]]):
+        """Sends message to everyone, after anything pending, keeping its encodings in payloads."""
+        self._flush_broadcasts()
+        self._send(message, payloads=payloads)
 
     async def broadcast_player_update(self):
-        player_list = [p.to_dict() for p in self.players.values()]
-        await self.broadcast({"type": "update_players", "players": sorted(player_list, key=lambda p: p['score'], reverse=True), "host_username": self.host.username})
+        # Only marks the list as dirty: a burst of calls builds it once, at flush time
+        self.queue_broadcast(_PLAYER_UPDATE)
+
+    def _player_update_message(self) -> dict:
+        # _scoreboard is already in order; only the dicts are built here
+        return {"type": "update_players", "players": [p.to_dict() for p in self._scoreboard], "host_username": self.host.username}
+
+    def broadcast_player_delta(self, player: Player, *fields: str):
+        """Sends only the fields that changed for one player; the order (by score) is unchanged."""
+        self.queue_broadcast({"type": "player_delta", "username": player.username, "fields": {f: getattr(player, f) for f in fields}})
 
-    async def add_player(self, player: Player):
+    async def add_player(self, player: Player) -> Player:
         if player.username not in self.players:
             self.players[player.username] = player
+            bisect.insort(self._scoreboard, player, key=_score_key)
+            # A late joiner also has to answer before the round can end early
+            self._pending_players += 1
         else:
             # If a player reconnects, update their websocket object
             self.players[player.username].websocket = player.websocket
+            self.players[player.username].binary = player.binary
+            player = self.players[player.username]
+        if player.websocket and player not in self._connected:
+            self._connected.append(player)
+        player.start_writer()
 
         # If the game has already been prepared, the new player needs the track titles
         # for the autocomplete functionality.
-        if self._preparation_complete_event.is_set() and player.websocket:
-            try:
-                logger.info(f"Sending prepared game details to late-joining player: {player.username}")
-                await player.websocket.send_json({"type": "game_prepared", "titles": self.all_playlist_titles})
-            except Exception as e:
-                logger.warning(f"Could not send prepared game details to player {player.username}: {e}")
+        if self._preparation_complete_event.is_set() and self._prepared_message and player.websocket:
+            logger.info(f"Sending prepared game details to late-joining player: {player.username}")
+            player.send_cached(self._prepared_message, self._prepared_payloads)
 
         # After adding, broadcast the new player list to everyone in the room
         await self.broadcast_player_update()
+        return player
 
     async def remove_player(self, username: str):
         if username in self.players:
-            self.players.pop(username)
+            player = self.players.pop(username)
+            self._scoreboard.remove(player)
+            if player in self._connected:
+                self._connected.remove(player)
+            player.stop_writer()
+            if not (player.has_answered or player.gave_up):
+                self._player_done()
             if not self.players or username == self.host.username:
                 self.game_state = "GAME_OVER"
                 if self._round_task: self._round_task.cancel()
@@ -154,45 +604,84 @@ class GameRoom:
 
     def _download_song_segment(self, search_query: str, output_path: str, duration: int):
         start_time = random.randint(20, 70)
-        # remove extensão .webm do caminho, yt-dlp vai adicionar sozinho
-        outtmpl = output_path[:-5] if output_path.endswith(".webm") else output_path  
-
-        ydl_opts = {
-            'format': 'bestaudio[ext=webm]/bestaudio/best',
-            'postprocessor_args': [
-                '-ss', str(start_time),
-                '-t', str(duration),
-                '-c:a', 'libopus',
-                '-b:a', '64k'
-            ],
-            'outtmpl': outtmpl,
-            'quiet': True,
-            'default_search': 'ytsearch1',
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'webm'
-            }]
-        }
-        if ARIA2C_PATH:
-            ydl_opts['external_downloader'] = ARIA2C_PATH
-            ydl_opts['external_downloader_args'] = ['-x', '16', '-s', '16', '-k', '1M']
+
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([search_query])
+            ydl = get_youtube_dl()
+            # O yt-dlp baixa só o trecho pedido e grava direto no arquivo final
+            ydl.params['download_ranges'] = yt_dlp.utils.download_range_func(None, [(start_time, start_time + duration)])
+            ydl.params['outtmpl'] = {'default': output_path}  # o YoutubeDL guarda o outtmpl já como dict
+            video_url = video_index.get(search_query)
+            if video_url:
+                # Already resolved once: skip the ytsearch and go straight to the video
+                try:
+                    ydl.download([video_url])
+                except Exception as e:
+                    # Taken down or blocked since: forget it and search again below
+                    logger.warning(f"Cached video {video_url} for '{search_query}' failed, searching again: {e}")
+                    video_index.discard(search_query)
+                    video_url = None
+            if not video_url:
+                info = ydl.extract_info(search_query, download=True)
+                if 'entries' in info:  # ytsearch returns a playlist with the single match
+                    info = next(iter(info['entries'] or []), None)
+                if not info:
+                    raise yt_dlp.utils.DownloadError(f"no results for '{search_query}'")
+                video_index.put(search_query, info['webpage_url'])
             logger.info(f"Segment downloaded: {output_path}")
             return True
         except Exception as e:
             logger.error(f"Download failed for '{search_query}': {e}")
             return False
 
+    def _download_preview(self, preview_url: str, output_path: str):
+        # Saved under static/audio rather than played from the CDN: the Web Audio
+        # analyser only gets samples from same-origin (or CORS-enabled) media
+        tmp_path = Path(f"{output_path}.tmp")
+        try:
+            with urllib.request.urlopen(preview_url, timeout=PREVIEW_TIMEOUT) as response:
+                tmp_path.write_bytes(response.read())
+            os.replace(tmp_path, output_path)
+            logger.info(f"Preview downloaded: {output_path}")
+            return True
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            logger.error(f"Preview download failed for '{preview_url}': {e}")
+            return False
 
 
     async def _download_wrapper(self, track: Dict):
-        track['download_status'] = 'downloading'
-        filepath = Path("static/audio") / track['file']
-        success = await asyncio.to_thread(self._download_song_segment, f"{track['artist']} - {track['title']} audio", str(filepath), self.game_settings["round_duration"])
+        # Tasks are created in round order and the semaphore is FIFO,
+        # so the first tracks always get a slot first
+        async with self._download_sem:
+            track['download_status'] = 'downloading'
+            task = _inflight_downloads.get(track['file'])
+            if task is None:
+                # Another room asking for the same file joins this download instead of starting its own
+                filepath = str(AUDIO_DIR / track['file'])
+                if track['preview_url']:
+                    job = run_ytdlp(self._download_preview, track['preview_url'], filepath)
+                else:
+                    job = run_ytdlp(self._download_song_segment, f"{track['artist']} - {track['title']} audio", filepath, self.game_settings["round_duration"])
+                task = asyncio.create_task(job)
+                _inflight_downloads[track['file']] = task
+                task.add_done_callback(lambda _: _inflight_downloads.pop(track['file'], None))
+            # Shielded so a room being reset doesn't cancel the download for everyone else
+            success = await asyncio.shield(task)
+        # Status first: the file is ready whatever happens in the cache bookkeeping
         track['download_status'] = 'downloaded' if success else 'failed'
         logger.info(f"Track {track['title']} status: {track['download_status']}")
+        if success:
+            await asyncio.to_thread(audio_cache.add, track['file'])
+
+    async def _wait_for_download(self, track: Dict, timeout: Optional[float] = DOWNLOAD_WAIT_TIMEOUT) -> bool:
+        """Waits for the track's download task; returns whether the file is ready."""
+        if track['download_status'] != 'downloaded' and track.get('download_task'):
+            try:
+                # shield: a timeout here must not cancel the download itself
+                await asyncio.wait_for(asyncio.shield(track['download_task']), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Room {self.room_id}: Timed out waiting for download of {track['title']}.")
+        return track['download_status'] == 'downloaded'
 
     async def prepare_game_in_background(self, is_rematch=False, starter_username=None):
         logger.info(f"Room {self.room_id}: Starting background preparation (is_rematch={is_rematch}).")
@@ -200,16 +689,21 @@ class GameRoom:
         if is_rematch:
             await self.broadcast({"type": "rematch_initiated", "message": "O anfitrião iniciou um novo jogo! Preparando novas músicas..."})
 
-        await self.fetch_playlist_details()
-        await self.broadcast({"type": "playlist_details_updated", "playlist_name": self.playlist_name, "playlist_cover_image_url": self.playlist_cover_image_url, "playlist_owner_name": self.playlist_owner_name})
+        # Independent Spotify requests: the details don't have to wait for the track pages
+        details_fetched, success = await asyncio.gather(self.fetch_playlist_details(), self.prepare_game_tracks())
+        # Nothing new to show if the fetch failed
+        if details_fetched:
+            await self.broadcast({"type": "playlist_details_updated", "playlist_name": self.playlist_name, "playlist_cover_image_url": self.playlist_cover_image_url, "playlist_owner_name": self.playlist_owner_name})
 
-        success = await self.prepare_game_tracks()
         if not success:
             await self.broadcast({"type": "system_message", "message": "Failed to prepare new tracks.", "level": "error"})
             self.game_state = "LOBBY"
             return
 
-        await self.broadcast({"type": "game_prepared", "titles": self.all_playlist_titles})
+        # The title list can be long: encoded once here, reused for late joiners
+        self._prepared_message = {"type": "game_prepared", "titles": self.all_playlist_titles}
+        self._prepared_payloads = {}
+        self.broadcast_cached(self._prepared_message, self._prepared_payloads)
         
         self._preparation_complete_event.set()
         logger.info(f"Room {self.room_id}: Track preparation is complete.")
@@ -220,13 +714,9 @@ class GameRoom:
         else:
             # Integrated host notification logic. This runs after preparation is done.
             if self.game_tracks:
-                first_track = self.game_tracks[0]
-                # If there's a download task, wait for it to complete
-                if first_track.get('download_task'):
-                    await first_track['download_task']
-                
-                # After waiting (or if no task existed, e.g., cached), check status
-                if first_track['download_status'] == 'downloaded':
+                # Wait for the first download, if any (cached tracks are ready right away).
+                # No timeout: the host must be told whenever it finishes.
+                if await self._wait_for_download(self.game_tracks[0], timeout=None):
                     logger.info(f"Room {self.room_id}: First track is ready.")
                     self.first_track_ready = True
                     # This check ensures we notify a host that is already connected.
@@ -234,39 +724,64 @@ class GameRoom:
                         logger.info(f"Room {self.room_id}: Host is connected. Notifying host.")
                         await self.broadcast({"type": "host_ready_to_start"}, to_host_only=True)
 
+    async def _fetch_playlist_details(self) -> Dict:
+        logger.info("Fetching playlist details from Spotify API.")
+        # Only what the room shows; the full object also carries the first page of tracks
+        return await run_spotify(sp.playlist, self.playlist_url, fields='name,owner.display_name,images')
+
+    async def _fetch_playlist_tracks(self) -> List[Dict]:
+        logger.info("Fetching playlist from Spotify API.")
+
+        def fetch_page(offset):
+            return run_spotify(sp.playlist_tracks, self.playlist_url, fields=PLAYLIST_FIELDS, limit=PAGE_SIZE, offset=offset)
+
+        # The first page gives the total; the remaining pages are fetched in parallel
+        first_page = await fetch_page(0)
+        pages = [first_page, *await asyncio.gather(*(fetch_page(offset) for offset in range(PAGE_SIZE, first_page['total'], PAGE_SIZE)))]
+        return [item['track'] for page in pages for item in page['items'] if item and item.get('track') and item['track'].get('id')]
+
     async def prepare_game_tracks(self):
         try:
-            if self.playlist_url in playlist_cache and (time.time() - playlist_cache[self.playlist_url][0]) < CACHE_TTL:
-                logger.info("Fetching playlist from cache.")
-                spotify_tracks = playlist_cache[self.playlist_url][1]
-            else:
-                logger.info("Fetching playlist from Spotify API.")
-                results = await asyncio.to_thread(sp.playlist_tracks, self.playlist_url)
-                spotify_tracks = []
-                while results:
-                    spotify_tracks.extend([item['track'] for item in results['items'] if item and item.get('track') and item['track'].get('id')])
-                    if results['next']:
-                        results = await asyncio.to_thread(sp.next, results)
-                    else:
-                        results = None
-                playlist_cache[self.playlist_url] = (time.time(), spotify_tracks)
-
-            self.all_playlist_titles = [track['name'] for track in spotify_tracks if track and track.get('name')]
-            unplayed_tracks = [t for t in spotify_tracks if t['id'] not in self.played_track_ids]
+            spotify_tracks = await playlist_cache.get(self.playlist_url, self._fetch_playlist_tracks)
+
+            # Single pass: titles for autocomplete + playable tracks not yet played
+            self.all_playlist_titles = []
+            unplayed_tracks = []
+            played = self.played_track_ids  # local name: looked up once, not per track
+            for track in spotify_tracks:
+                if not track.get('name'): continue
+                self.all_playlist_titles.append(track['name'])
+                if track.get('artists') and track['id'] not in played:
+                    unplayed_tracks.append(track)
             if not unplayed_tracks:
                 await self.broadcast({"type": "system_message", "message": "All tracks from this playlist have been played!", "level": "error"})
                 return False
 
-            random.shuffle(unplayed_tracks)
             num_rounds = min(self.game_settings["total_rounds"], len(unplayed_tracks))
             self.game_settings["total_rounds"] = num_rounds
-            selected_tracks = unplayed_tracks[:num_rounds]
+            # Only touches the tracks it picks, instead of shuffling the whole playlist
+            selected_tracks = random.sample(unplayed_tracks, num_rounds)
             
+            # Spotify's 30s preview covers short rounds: a single GET instead of a YouTube search and cut
+            use_previews = self.game_settings["round_duration"] <= PREVIEW_DURATION
+            previews = [track_data.get('preview_url') if use_previews else None for track_data in selected_tracks]
+            filenames = [f"{track_data['id']}.mp3" if preview_url else f"{track_data['id']}.webm" for track_data, preview_url in zip(selected_tracks, previews)]
+            # This game's files (cached or still to download) can't be evicted until it's over.
+            # Pinning also tells which are already on disk, off the event loop
+            pin = asyncio.ensure_future(asyncio.to_thread(audio_cache.pin, filenames))
+            try:
+                existing_files = await asyncio.shield(pin)
+            except asyncio.CancelledError:
+                # Room closed mid-pin: the pin still lands in the worker thread, so give it back once it has
+                def unpin(done):
+                    if not done.exception():
+                        asyncio.create_task(asyncio.to_thread(audio_cache.unpin, filenames))
+                pin.add_done_callback(unpin)
+                raise
+            self._pinned_files = filenames
             self.game_tracks = []
-            for track_data in selected_tracks:
-                if not track_data.get('name') or not track_data.get('artists'): continue
-                filepath = Path("static/audio") / f"{track_data['id']}.webm"
-                self.game_tracks.append({"id": track_data['id'], "title": track_data['name'], "artist": track_data['artists'][0]['name'], "file": f"{track_data['id']}.webm", "download_status": 'downloaded' if filepath.exists() else 'pending', "download_task": None})
+            for track_data, preview_url, filename in zip(selected_tracks, previews, filenames):
+                self.game_tracks.append({"id": track_data['id'], "title": track_data['name'], "artist": track_data['artists'][0]['name'], "file": filename, "preview_url": preview_url, "accepted_titles": accepted_titles(track_data['name']), "download_status": 'downloaded' if filename in existing_files else 'pending', "download_task": None})
             
             self._download_tasks = [asyncio.create_task(self._download_wrapper(track)) for track in self.game_tracks if track['download_status'] == 'pending']
             for i, track in enumerate(t for t in self.game_tracks if t['download_status'] == 'pending'):
@@ -292,10 +807,9 @@ class GameRoom:
         first_track = self.game_tracks[0]
         if first_track['download_status'] != 'downloaded':
             logger.info(f"Room {self.room_id}: Waiting for first track download to complete before starting.")
-            if first_track['download_task']:
-                await first_track['download_task']
-    
-        if first_track['download_status'] != 'downloaded':
+
+        # No timeout: the game can't start without this song, so only a real failure aborts it
+        if not await self._wait_for_download(first_track, timeout=None):
             await self.broadcast({"type": "system_message", "message": "Failed to download the first song.", "level": "error"})
             return
 
@@ -318,15 +832,16 @@ class GameRoom:
 
         if self.current_song['download_status'] != 'downloaded':
             await self.broadcast({"type": "system_message", "message": f"Downloading song for round {self.current_round}...", "level": "info"})
-            if self.current_song['download_task']: await self.current_song['download_task']
-        
-        if self.current_song['download_status'] == 'failed':
+
+        # Failed or still not done after the timeout: skip the round
+        if not await self._wait_for_download(self.current_song):
             await self.broadcast({"type": "system_message", "message": "Could not download song, skipping round.", "level": "error"})
             await asyncio.sleep(3)
             return
 
         for p in self.players.values(): p.reset_for_new_round()
         self._round_end_event.clear()
+        self._pending_players = len(self.players)
         
         await self.broadcast_player_update()
         await self.broadcast({"type": "round_countdown"})
@@ -347,40 +862,49 @@ class GameRoom:
         finally:
             await self.end_round()
 
+    def _release_audio(self):
+        """Unpins this game's files so the audio cache may evict them again."""
+        if self._pinned_files:
+            files, self._pinned_files = self._pinned_files, []
+            asyncio.create_task(asyncio.to_thread(audio_cache.unpin, files))
+
+    def _player_done(self):
+        """Counts one player as finished for the round; ends it early once nobody is left."""
+        self._pending_players -= 1
+        if self._pending_players <= 0:
+            self._round_end_event.set()
+
     async def handle_guess(self, username: str, guess_text: str):
-        logger.info(f"Entering handle_guess for {username}. Current game_state: {self.game_state}")
         player = self.players.get(username)
         if self.game_state != "PLAYING" or not player or player.has_answered or player.gave_up:
-            logger.info(f"handle_guess conditions not met for {username}. game_state: {self.game_state}, player: {player}, has_answered: {player.has_answered if player else 'N/A'}, gave_up: {player.gave_up if player else 'N/A'}")
+            logger.debug("Ignoring guess from %s (game_state: %s)", username, self.game_state)
             return
 
         normalized_guess = normalize_string(guess_text)
-        normalized_song_title = normalize_string(self.current_song['title'])
+        # Accepted titles are normalized during preparation, not once per guess
+        accepted = self.current_song['accepted_titles']
 
-        logger.info(f"Raw Guess: {guess_text}")
-        logger.info(f"Raw Song Title: {self.current_song['title']}")
-        logger.info(f"Normalized Guess: {normalized_guess}")
-        logger.info(f"Normalized Song Title: {normalized_song_title}")
+        # Lazy %-formatting: this runs for every guess and is off at the default INFO level
+        logger.debug("Guess %r -> %r, accepted: %s", guess_text, normalized_guess, accepted)
 
-        if normalized_guess == normalized_song_title:
+        if normalized_guess in accepted:
             time_taken = time.time() - self.round_start_time
             player.has_answered = True
             player.guess_time = time_taken
             logger.info(f"Player {username} guessed correctly in {time_taken:.1f}s.")
-            await self.broadcast({"type": "system_message", "message": f"✅ {username} acertou!", "level": "info"})
-            await self.broadcast_player_update()
-            if all(p.has_answered or p.gave_up for p in self.players.values()): self._round_end_event.set()
+            self.queue_broadcast({"type": "system_message", "message": f"✅ {username} acertou!", "level": "info"})
+            self.broadcast_player_delta(player, "has_answered", "guess_time")
+            self._player_done()
         else:
-            await player.websocket.send_json({"type": "guess_result", "correct": False, "message": "Você errou! Tente novamente."})
-            logger.info(f"Sent wrong guess feedback to {username}.")
+            player.send_message({"type": "guess_result", "correct": False, "message": "Você errou! Tente novamente."})
 
     async def handle_give_up(self, username: str):
         player = self.players.get(username)
         if self.game_state != "PLAYING" or not player or player.has_answered or player.gave_up: return
         player.gave_up = True
-        await self.broadcast_player_update()
-        await self.broadcast({"type": "system_message", "message": f"⚠️ {username} desistiu da rodada!", "level": "info"})
-        if all(p.has_answered or p.gave_up for p in self.players.values()): self._round_end_event.set()
+        self.broadcast_player_delta(player, "gave_up")
+        self.queue_broadcast({"type": "system_message", "message": f"⚠️ {username} desistiu da rodada!", "level": "info"})
+        self._player_done()
 
     async def end_round(self):
         if self.game_state == "ROUND_OVER": return
@@ -420,8 +944,10 @@ class GameRoom:
             pontuacao_final = round(pontos + bonus_primeiro + bonus_unico)
             player.score += pontuacao_final
             
-            await self.broadcast({"type": "system_message", "message": f"✨ {player.username} ganhou {pontuacao_final} pontos!", "level": "info"})
+            self.queue_broadcast({"type": "system_message", "message": f"✨ {player.username} ganhou {pontuacao_final} pontos!", "level": "info"})
 
+        # Scores only change here; the list is nearly sorted, so this is close to linear
+        self._scoreboard.sort(key=_score_key)
         await self.broadcast_player_update()
 
         for p in self.players.values():
@@ -433,22 +959,21 @@ class GameRoom:
     async def end_game(self):
         self.game_state = "GAME_OVER"
         self.played_track_ids.update(t['id'] for t in self.game_tracks)
+        self._release_audio()
 
-        player_list = [p.to_dict() for p in self.players.values()]
-        if player_list:
-            winner = max(player_list, key=lambda p: p['score'])
+        if self._scoreboard:
+            # The scoreboard is sorted, so the winner is the first player
+            winner_player = self._scoreboard[0]
+            winner = winner_player.to_dict()
             
             # Increment wins for the winner
-            winner_player = self.players.get(winner['username'])
-            if winner_player:
-                winner_player.wins += 1
-            
-            # Get updated player list with new win count
-            player_list = [p.to_dict() for p in self.players.values()]
+            winner_player.wins += 1
         else:
             winner = None
 
-        await self.broadcast({"type": "game_over", "scoreboard": sorted(player_list, key=lambda p: p['score'], reverse=True), "winner": winner})
+        # Built after the increment, so it carries the new win count
+        player_list = [p.to_dict() for p in self._scoreboard]
+        await self.broadcast({"type": "game_over", "scoreboard": player_list, "winner": winner})
 
     async def reset_for_new_game(self, new_playlist_url: Optional[str], starter_username: str):
         if starter_username != self.host.username: return
@@ -458,14 +983,20 @@ class GameRoom:
         if new_playlist_url:
             logger.info(f"Room {self.room_id}: Using new playlist: {new_playlist_url}")
             self.playlist_url = new_playlist_url
-            playlist_cache.pop(self.playlist_url, None)
+            playlist_cache.pop(self.playlist_url)
+            playlist_details_cache.pop(self.playlist_url)
             self.played_track_ids.clear()
 
         self.game_state = "LOBBY"
+        self._release_audio()
         self.game_tracks = []
         self.all_playlist_titles = []
+        self._prepared_message = None
+        self._prepared_payloads = {}
         self.first_track_ready = False
         self._preparation_complete_event.clear()
+        # A preparation still running would pin files after the release above
+        if self._prepare_task: self._prepare_task.cancel()
         for task in self._download_tasks: task.cancel()
         self._download_tasks = []
 
@@ -474,7 +1005,7 @@ class GameRoom:
 
         await self.broadcast_player_update()
 
-        asyncio.create_task(self.prepare_game_in_background(is_rematch=True, starter_username=starter_username))
+        self._prepare_task = asyncio.create_task(self.prepare_game_in_background(is_rematch=True, starter_username=starter_username))
 
 class GameManager:
     def __init__(self):
@@ -483,7 +1014,7 @@ class GameManager:
     def create_room(self, host: Player, playlist: str, duration: int, total_rounds: int) -> GameRoom:
         room = GameRoom(host, playlist, duration, total_rounds)
         self.rooms[room.room_id] = room
-        asyncio.create_task(room.prepare_game_in_background())
+        room._prepare_task = asyncio.create_task(room.prepare_game_in_background())
         return room
 
     def get_room(self, room_id: str) -> Optional[GameRoom]:
@@ -493,7 +1024,11 @@ class GameManager:
         if room_id in self.rooms:
             room = self.rooms[room_id]
             if room._round_task: room._round_task.cancel()
+            # Otherwise a preparation finishing later would pin files nobody unpins
+            if room._prepare_task: room._prepare_task.cancel()
             for task in room._download_tasks: task.cancel()
+            for player in room.players.values(): player.stop_writer()
+            room._release_audio()
             del self.rooms[room_id]
             logger.info(f"Sala {room_id} removida.")
 
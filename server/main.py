@@ -2,9 +2,11 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPExcept
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from game_manager import game_manager, Player, sp
+from game_manager import game_manager, Player, sp, run_spotify, keep_spotify_warm, video_index
 from spotipy import SpotifyException
+import asyncio
 import logging
+import orjson
 import uvicorn
 
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +17,16 @@ app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/client", StaticFiles(directory="../client/public"), name="client")
 
+@app.on_event("startup")
+async def warm_up_spotify():
+    # Guardado no app para a task não ser coletada pelo garbage collector
+    app.state.spotify_keepalive = asyncio.create_task(keep_spotify_warm())
+
+@app.on_event("shutdown")
+async def save_video_index():
+    # Grava o que ainda estiver esperando o próximo lote
+    await asyncio.to_thread(video_index.flush)
+
 # Modelo atualizado para a requisição de criação de sala
 class CreateRoomRequest(BaseModel):
     username: str
@@ -53,7 +65,8 @@ async def search_playlists(query: str):
     if not query:
         return []
     try:
-        results = sp.search(q=query, type='playlist', limit=10)
+        # spotipy is synchronous: keep the HTTP request off the event loop
+        results = await run_spotify(sp.search, q=query, type='playlist', limit=10)
         playlists = []
         for item in results['playlists']['items']:
             if item:
@@ -70,12 +83,14 @@ async def search_playlists(query: str):
 
 @app.websocket("/ws/{room_id}/{username}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str):
-    await websocket.accept()
+    # Clients that can decode MessagePack ask for the 'msgpack' subprotocol; the rest get JSON
+    binary = 'msgpack' in websocket.scope.get('subprotocols', [])
+    await websocket.accept(subprotocol='msgpack' if binary else None)
     room = game_manager.get_room(room_id)
 
     if not room:
         logger.warning(f"Connection attempt to non-existent room {room_id}")
-        await websocket.send_json({"type": "error", "message": "Sala não encontrada."})
+        await websocket.send_text(orjson.dumps({"type": "error", "message": "Sala não encontrada."}).decode())
         await websocket.close(code=4004)
         return
 
@@ -84,20 +99,23 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str):
     if username == room.host.username:
         player = room.host
         player.websocket = websocket
+        player.binary = binary
     else:
         # Check if a player with the same name is already connected.
         if username in room.players and room.players[username].websocket:
-            await websocket.send_json({"type": "error", "message": f"O nome de usuário '{username}' já está em uso nesta sala."})
+            await websocket.send_text(orjson.dumps({"type": "error", "message": f"O nome de usuário '{username}' já está em uso nesta sala."}).decode())
             await websocket.close(code=4009)
             return
-        player = Player(username=username, websocket=websocket)
+        player = Player(username=username, websocket=websocket, binary=binary)
 
     try:
-        await room.add_player(player)
+        # Reconnecting players get their existing Player object back
+        player = await room.add_player(player)
         logger.info(f"Player {username} connected to room {room_id}.")
         
         # CRITICAL FIX: Send the room_joined event to the client that just connected.
-        await websocket.send_json({
+        # Goes through the player's queue so it stays ordered with the broadcasts.
+        player.send_message({
             "type": "room_joined",
             "room_id": room.room_id,
             "is_host": username == room.host.username,
@@ -111,11 +129,12 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str):
         # If the host connects and the first track is already ready, notify them.
         if username == room.host.username and room.first_track_ready:
             logger.info(f"Host {username} connected and first track is ready. Notifying host.")
-            await websocket.send_json({"type": "host_ready_to_start"})
+            player.send_message({"type": "host_ready_to_start"})
 
         while True:
-            data = await websocket.receive_json()
-            logger.info(f"Received from {username} in {room_id}: {data}")
+            # Clients always send JSON text, even on a msgpack connection
+            data = orjson.loads(await websocket.receive_text())
+            logger.debug("Received from %s in %s: %s", username, room_id, data)
             
             if data['type'] == 'start_game':
                 await room.start_game(username)